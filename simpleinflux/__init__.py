@@ -9,6 +9,21 @@ pw = ""
 default_db = ""
 default_measurement = ""
 
+# Opt-in parallel parsing of read responses, see read_all(parallel=True):
+parallel_parse_threshold = 8 * 1024 * 1024  # minimum bytes per worker, below 2x in-process
+parallel_parse_processes = None  # None means os.cpu_count()
+parallel_parse_chunk_size = 10000  # rows per chunk requested from InfluxDB
+
+# Retries and circuit breaker shared by all requests, see resilience.py:
+request_timeout = (3.05, None)  # seconds to connect, seconds to wait for a response
+retries = 3  # retries after failed connects and 429/502/503/504
+backoff_base = 0.1  # seconds, doubled on every retry and jittered
+backoff_max = 10.0  # seconds
+retry_after_max = 60.0  # seconds, longer Retry-After values are not waited for
+circuit_breaker_threshold = 5  # failed requests in a row before failing fast
+circuit_breaker_timeout = 30.0  # seconds before a trial request is let through
+health_cache_ttl = 10.0  # seconds a successful request counts as a good ping
+
 
 from .simpleinflux import ping
 from .simpleinflux import get_influx_version
@@ -22,3 +37,4 @@ from .simpleinflux import read_latest
 from .simpleinflux import read_all
 from .simpleinflux import read_range
 from .simpleinflux import read_special_range
+from .resilience import reset_health
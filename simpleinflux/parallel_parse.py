@@ -0,0 +1,284 @@
+""" Parse chunked InfluxDB query responses, in a process pool if they are large
+
+With chunked=true, InfluxDB answers with one JSON document per line, each holding
+up to chunk_size rows. Lines are a safe place to split the body, because JSON
+escapes newlines inside strings. The body is put into a shared memory block, every
+worker decodes and transposes a contiguous range of lines, reading it through a
+memoryview one line at a time, and hands its columns back in shared memory blocks.
+Every worker gets a range of at least threshold bytes, so a response just above
+the threshold doesn't start a process per core.
+
+Int, float and bool columns travel as raw arrays and are turned back into lists
+with one tolist() per range. Only if a column contains nulls, or both ints and
+floats (InfluxDB writes whole-valued floats as ints), a byte per row restores
+those exactly, which costs a pass over the rows in the parent. String columns
+can't be stored as a flat array, they are JSON-encoded into their block and
+decoded in the parent, so they gain little from the pool.
+"""
+
+import os
+import re
+import json
+import array
+import concurrent.futures
+from multiprocessing import shared_memory
+
+INT64_MIN = -(2 ** 63)
+INT64_MAX = 2 ** 63 - 1
+FLOAT_EXACT_INT_MAX = 2 ** 53
+
+# Per-row flags, stored after the array if a column needs them:
+FLAG_AS_STORED = 0
+FLAG_INT = 1
+FLAG_NULL = 2
+
+
+def _parse_lines(body):
+    """ Decode newline-delimited chunks, return (columns, rows) in response order
+
+    body can be bytes or a memoryview, which is copied only one line at a time.
+    """
+
+    columns = None
+    rows = []
+
+    line_ends = [match.end() for match in re.finditer(b"\n", body)]
+    if not line_ends or line_ends[-1] < len(body):
+        line_ends.append(len(body))
+
+    start = 0
+    for end in line_ends:
+        line = bytes(body[start:end])
+        start = end
+        if not line.strip():
+            continue
+        result = json.loads(line)["results"][0]
+        if "error" in result:
+            raise ValueError(f"Query returned: '{result['error']}'")
+        if "messages" in result:
+            print(result["messages"])
+        for series in result.get("series", []):
+            if columns is None:
+                columns = series["columns"]
+            rows.extend(series["values"])
+
+    return columns, rows
+
+
+def _transpose(rows, n_columns):
+    return [[row[i] for row in rows] for i in range(n_columns)]
+
+
+def _column_typecode(values):
+    """ Array typecode to store the column in, None if it has to go through JSON
+
+    'q' for int64, 'd' for float (ints mixed in are flagged per row), 'b' for bool.
+    """
+
+    has_int = has_float = has_bool = False
+    for v in values:
+        if v is None:
+            continue
+        value_type = type(v)
+        if value_type is bool:
+            has_bool = True
+        elif value_type is int:
+            if not INT64_MIN <= v <= INT64_MAX:
+                return None
+            has_int = True
+        elif value_type is float:
+            has_float = True
+        else:
+            return None
+
+    if has_bool:
+        return None if has_int or has_float else "b"
+    if has_float:
+        if has_int and any(
+            type(v) is int and abs(v) > FLOAT_EXACT_INT_MAX for v in values
+        ):
+            return None
+        return "d"
+    return "q"
+
+
+def _free(descriptor):
+    """ Unlink the block of a descriptor that won't be read back """
+    try:
+        shm = shared_memory.SharedMemory(name=descriptor[0])
+    except FileNotFoundError:
+        return
+    shm.close()
+    shm.unlink()
+
+
+def _column_to_shared_memory(values):
+    """ Copy one column into a new shared memory block, return its descriptor """
+
+    typecode = _column_typecode(values)
+
+    if typecode is None:
+        payload = json.dumps(values).encode()
+        has_flags = False
+    else:
+        has_flags = None in values or (
+            typecode == "d" and any(type(v) is int for v in values)
+        )
+        payload = array.array(typecode, [0 if v is None else v for v in values])
+        payload = payload.tobytes()
+        if has_flags:
+            payload += bytes(
+                FLAG_NULL
+                if v is None
+                else FLAG_INT
+                if typecode == "d" and type(v) is int
+                else FLAG_AS_STORED
+                for v in values
+            )
+
+    shm = shared_memory.SharedMemory(create=True, size=max(len(payload), 1))
+    shm.buf[: len(payload)] = payload
+    shm.close()
+
+    return shm.name, typecode, len(payload), has_flags
+
+
+def _column_from_shared_memory(descriptor, n_rows):
+    """ Read back a column written by _column_to_shared_memory and free its block """
+
+    name, typecode, size, has_flags = descriptor
+
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        payload = bytes(shm.buf[:size])
+    finally:
+        shm.close()
+        shm.unlink()
+
+    if typecode is None:
+        return json.loads(payload)
+
+    column = array.array(typecode)
+    column.frombytes(payload[: n_rows * column.itemsize])
+    values = column.tolist()
+    if typecode == "b":
+        values = list(map(bool, values))
+    if has_flags:
+        flags = payload[n_rows * column.itemsize :]
+        values = [
+            None if flag == FLAG_NULL else int(v) if flag == FLAG_INT else v
+            for v, flag in zip(values, flags)
+        ]
+    return values
+
+
+def _parse_range_worker(body_shm_name, start, end):
+    """ Runs in the pool: parse body[start:end], return column descriptors """
+
+    body_shm = shared_memory.SharedMemory(name=body_shm_name)
+    body = body_shm.buf[start:end]
+    try:
+        columns, rows = _parse_lines(body)
+    finally:
+        body.release()
+        body_shm.close()
+
+    if columns is None:
+        return None, 0, []
+
+    descriptors = []
+    try:
+        for values in _transpose(rows, len(columns)):
+            descriptors.append(_column_to_shared_memory(values))
+    except BaseException:
+        for descriptor in descriptors:
+            _free(descriptor)
+        raise
+    return columns, len(rows), descriptors
+
+
+def _split_at_newlines(body, n_ranges):
+    """ Cut body into at most n_ranges (start, end) pairs, each ending after a newline """
+
+    ranges = []
+    start = 0
+    for i in range(1, n_ranges):
+        cut = body.find(b"\n", max(start, len(body) * i // n_ranges))
+        if cut == -1:
+            break
+        ranges.append((start, cut + 1))
+        start = cut + 1
+    if start < len(body):
+        ranges.append((start, len(body)))
+    return ranges
+
+
+def _parse_in_pool(body, processes):
+
+    ranges = _split_at_newlines(body, processes)
+
+    body_shm = shared_memory.SharedMemory(create=True, size=max(len(body), 1))
+    try:
+        body_shm.buf[: len(body)] = body
+        with concurrent.futures.ProcessPoolExecutor(len(ranges)) as executor:
+            futures = [
+                executor.submit(_parse_range_worker, body_shm.name, start, end)
+                for start, end in ranges
+            ]
+            # Wait for all of them, so no worker still creates blocks if one fails.
+            # A worker that dies (e.g. OOM-killed) fails every future with
+            # BrokenProcessPool instead of leaving us waiting:
+            concurrent.futures.wait(futures)
+    finally:
+        body_shm.close()
+        body_shm.unlink()
+
+    range_results = [f.result() for f in futures if f.exception() is None]
+    pending = [d for _, _, descriptors in range_results for d in descriptors]
+
+    try:
+        for future in futures:
+            if future.exception() is not None:
+                future.result()  # re-raises the exception of the worker
+
+        # Collect the columns of every range, in order, so the rows stay in time order:
+        columns = None
+        column_values = []
+        for range_columns, n_rows, descriptors in range_results:
+            range_values = []
+            for descriptor in descriptors:
+                pending.remove(descriptor)
+                range_values.append(_column_from_shared_memory(descriptor, n_rows))
+            if range_columns is None:
+                continue
+            if columns is None:
+                columns = range_columns
+                column_values = [[] for _ in columns]
+            for values, new_values in zip(column_values, range_values):
+                values.extend(new_values)
+    finally:
+        for descriptor in pending:
+            _free(descriptor)
+
+    return columns, column_values
+
+
+def parse_chunked_response(body, threshold, processes=None):
+    """ Turn a chunked response body into (columns, list of values per column)
+
+    The body is split into ranges of at least threshold bytes, at most one per
+    process, and parsed in this process if that leaves a single range. Returns
+    (None, []) if the response contains no series.
+    """
+
+    if not processes:
+        processes = os.cpu_count() or 1
+    processes = min(processes, len(body) // max(threshold, 1))
+
+    if processes < 2:
+        columns, rows = _parse_lines(body)
+        if columns is None:
+            return None, []
+        return columns, _transpose(rows, len(columns))
+
+    return _parse_in_pool(body, processes)
@@ -0,0 +1,207 @@
+""" Retries, backoff and a per-host circuit breaker for all requests to InfluxDB
+
+Every request goes through request(), which retries failed connection attempts
+and retryable status codes with jittered exponential backoff, honours Retry-After,
+and records the outcome per host. After circuit_breaker_threshold failed requests
+in a row, requests to that host fail fast until circuit_breaker_timeout has
+passed, then a single trial request decides whether the circuit closes again.
+The recorded outcomes also let ping() answer from cache.
+
+Only idempotent requests are retried. GET is, and so are the POSTs this package
+sends to InfluxDB 1.x: writing a point again with the same timestamp and tags
+overwrites it, and CREATE/DROP DATABASE don't fail if they were already done.
+Timeouts while waiting for a response are never retried and say nothing about the
+host's health, since a heavy query can simply take that long. Neither does a 429:
+the server is up, it's just asking us to slow down.
+"""
+
+import time
+import random
+import threading
+import email.utils
+
+import requests
+
+import simpleinflux  # in order to access the package-level settings
+
+RETRYABLE_STATUS_CODES = (429, 502, 503, 504)
+TOO_MANY_REQUESTS_STATUS_CODE = 429
+SERVER_ERROR_STATUS_CODE = 500
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+class HostHealth:
+    """ Outcome of the recent requests to one host:port """
+
+    def __init__(self):
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.trial_in_progress = False
+        self.last_success = None
+
+    def is_open(self):
+        return self.opened_at is not None
+
+    def recently_ok(self):
+        return (
+            self.last_success is not None
+            and not self.is_open()
+            and time.monotonic() - self.last_success < simpleinflux.health_cache_ttl
+        )
+
+
+_health = {}
+_health_lock = threading.Lock()
+
+
+def get_health(host, port):
+    with _health_lock:
+        return _health.setdefault((host, port), HostHealth())
+
+
+def reset_health():
+    """ Forget all recorded outcomes, closing every circuit """
+    with _health_lock:
+        _health.clear()
+
+
+def _allow_request(health, url):
+    """ Raise ConnectionError if the circuit is open, let one trial through after the timeout
+
+    Returns True if this request is the trial.
+    """
+
+    with _health_lock:
+        if not health.is_open():
+            return False
+        open_for = time.monotonic() - health.opened_at
+        if open_for >= simpleinflux.circuit_breaker_timeout and not health.trial_in_progress:
+            health.trial_in_progress = True
+            return True
+
+    raise ConnectionError(
+        f"Circuit open for {url} after {health.consecutive_failures} failed requests, "
+        f"is influxd running?"
+    )
+
+
+def _record_success(health):
+    with _health_lock:
+        health.consecutive_failures = 0
+        health.opened_at = None
+        health.trial_in_progress = False
+        health.last_success = time.monotonic()
+
+
+def _record_failure(health):
+    with _health_lock:
+        health.consecutive_failures += 1
+        health.trial_in_progress = False
+        if (
+            health.is_open()
+            or health.consecutive_failures >= simpleinflux.circuit_breaker_threshold
+        ):
+            health.opened_at = time.monotonic()
+
+
+def _retry_after_s(res):
+    """ Parse the Retry-After header (seconds or HTTP date), None if absent or invalid """
+
+    value = res.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+def _backoff_s(attempt):
+    """ Full jitter: uniform between 0 and the capped exponential backoff """
+    cap = min(simpleinflux.backoff_max, simpleinflux.backoff_base * 2 ** attempt)
+    return random.uniform(0, cap)
+
+
+def _record_given_up(health, res):
+    """ Record a retryable response we stopped retrying, unless it was a 429 """
+    if res.status_code == TOO_MANY_REQUESTS_STATUS_CODE:
+        return
+    _record_failure(health)
+
+
+def _request_with_retries(health, method, url, retries, **kwargs):
+
+    attempt = 0
+    while True:
+        try:
+            res = requests.request(method=method, url=url, **kwargs)
+        except requests.exceptions.ReadTimeout:
+            raise TimeoutError(
+                f"{url} did not respond within the read timeout ({kwargs['timeout']})"
+            ) from None
+        except requests.exceptions.ConnectionError:
+            # Includes ConnectTimeout, nothing reached the server in that case.
+            if attempt >= retries:
+                _record_failure(health)
+                raise ConnectionError(
+                    f"Could not connect to {url}, is influxd running?"
+                ) from None
+            time.sleep(_backoff_s(attempt))
+            attempt += 1
+            continue
+
+        if res.status_code not in RETRYABLE_STATUS_CODES:
+            if res.status_code < SERVER_ERROR_STATUS_CODE:
+                # Also for e.g. a 400 on a bad query: the server is up and answering.
+                _record_success(health)
+            else:
+                # Other server errors aren't worth retrying, but the server isn't healthy:
+                _record_failure(health)
+            return res
+
+        if attempt >= retries:
+            _record_given_up(health, res)
+            return res
+
+        delay_s = _backoff_s(attempt)
+        retry_after_s = _retry_after_s(res)
+        if retry_after_s is not None:
+            if retry_after_s > simpleinflux.retry_after_max:
+                # Rather give up now than block for that long or retry too early:
+                _record_given_up(health, res)
+                return res
+            delay_s = max(delay_s, retry_after_s)
+        time.sleep(delay_s)
+        attempt += 1
+
+
+def request(method, url, host, port, idempotent=None, **kwargs):
+    """ requests.request() with retries and the circuit breaker of host:port
+
+    idempotent defaults to True for GET, HEAD and OPTIONS, other requests are only
+    retried if the caller says they are safe to repeat.
+    Returns the last response, which may still be not ok if the retries ran out or
+    the status is not retryable. Raises ConnectionError if the host can't be reached,
+    TimeoutError if it doesn't respond within the read timeout.
+    """
+
+    if idempotent is None:
+        idempotent = method in IDEMPOTENT_METHODS
+    retries = simpleinflux.retries if idempotent else 0
+
+    health = get_health(host, port)
+    is_trial = _allow_request(health, url)
+    kwargs.setdefault("timeout", simpleinflux.request_timeout)
+
+    try:
+        return _request_with_retries(health, method, url, retries, **kwargs)
+    finally:
+        # Whatever interrupted the trial, don't let it keep the circuit open for good:
+        if is_trial:
+            with _health_lock:
+                health.trial_in_progress = False
@@ -1,9 +1,9 @@
 import time
 import datetime
-import socket
-import requests
 
 import simpleinflux  # in order to access the package-level variables default_*
+from .parallel_parse import parse_chunked_response
+from .resilience import request, get_health
 
 VALID_TIMESTAMP_UNITS = ("ns", "u", "µ", "ms", "s", "m", "h", "d", "w")
 TIME_UNIT_MULTIPLIERS = {"s": 1000 ** 3, "ms": 1000 ** 2, "us": 1000, "ns": 1}
@@ -21,31 +21,19 @@ def _substitute_defaults(host=None, port=None, db=None):
     return host, port, db
 
 
-def _port_reachable(host="localhost", port=8086):
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-        return sock.connect_ex((host, port)) == 0
+def ping(raise_on_fail=True, host="localhost", port=8086, use_cache=True):
 
+    # A request that succeeded recently already shows that InfluxDB is up:
+    if use_cache and get_health(host, port).recently_ok():
+        return True
 
-def ping(raise_on_fail=True, host="localhost", port=8086):
-
-    # First, check if we can connect to the port:
-    if not _port_reachable(host, port):
-        if raise_on_fail:
-            raise ConnectionError(
-                f"Could not connect to port {port}, is influxd running?"
-            )
-        else:
-            return False
-
-    # Second, GET the /ping endpoint check if result is good (204):
+    # GET the /ping endpoint check if result is good (204):
     ping_endpoint_url = f"http://{host}:{port}/ping"
     try:
-        res = requests.get(url=ping_endpoint_url)
-    except requests.exceptions.ConnectionError:
+        res = request("GET", ping_endpoint_url, host, port)
+    except ConnectionError:
         if raise_on_fail:
-            raise ConnectionError(
-                f"Could not connect to {ping_endpoint_url}, is influxd running?"
-            ) from None
+            raise
         return False
 
     if not res.ok:
@@ -64,18 +52,15 @@ def get_influx_version(host=None, port=None):
     host, port, _ = _substitute_defaults(host=host, port=port)
 
     ping_endpoint_url = f"http://{host}:{port}/ping"
-    try:
-        res = requests.get(url=ping_endpoint_url)
-    except requests.exceptions.ConnectionError:
-        raise ConnectionError(
-            f"Could not connect to {ping_endpoint_url}, is influxd running?"
-        ) from None
+    res = request("GET", ping_endpoint_url, host, port)
 
     version_string = res.headers["X-Influxdb-Version"]
     return version_string
 
 
-def _query(query, host=None, port=None, db=None, output_timestamp_unit="s"):
+def _query(
+    query, host=None, port=None, db=None, output_timestamp_unit="s", chunked=False
+):
 
     host, port, db = _substitute_defaults(host=host, port=port, db=db)
 
@@ -84,15 +69,28 @@ def _query(query, host=None, port=None, db=None, output_timestamp_unit="s"):
     else:
         method = "GET"
 
-    res = requests.request(
-        method=method,
-        url=f"http://{host}:{port}/query?db={db}",
-        params={"q": query, "epoch": output_timestamp_unit},
+    params = {"q": query, "epoch": output_timestamp_unit}
+    if chunked:
+        params["chunked"] = "true"
+        params["chunk_size"] = simpleinflux.parallel_parse_chunk_size
+
+    # CREATE and DROP are POSTs, but repeating them does no harm:
+    res = request(
+        method,
+        f"http://{host}:{port}/query?db={db}",
+        host,
+        port,
+        idempotent=True,
+        params=params,
     )
 
     if not res.ok:
         raise ConnectionError(f"{query} returned {res.status_code}:{res.text}")
 
+    # Chunked responses are one JSON document per line, _query_columns checks those:
+    if chunked:
+        return res
+
     if "error" in res.json()["results"][0]:
         error_message = res.json()["results"][0]["error"]
         raise ValueError(f"{query} returned: '{error_message}'")
@@ -103,6 +101,22 @@ def _query(query, host=None, port=None, db=None, output_timestamp_unit="s"):
     return res
 
 
+def _query_columns(query, host=None, port=None, db=None, output_timestamp_unit="s"):
+    """ Request query as a chunked response and return (columns, values per column)
+
+    Responses larger than simpleinflux.parallel_parse_threshold bytes are decoded
+    and transposed in a process pool. Returns (None, []) if there is no series.
+    """
+
+    res = _query(query, host, port, db, output_timestamp_unit, chunked=True)
+
+    return parse_chunked_response(
+        res.content,
+        threshold=simpleinflux.parallel_parse_threshold,
+        processes=simpleinflux.parallel_parse_processes,
+    )
+
+
 def create_database(db, host=None, port=None):
     host, port, db = _substitute_defaults(host=host, port=port, db=db)
     query = f"CREATE DATABASE {db}"
@@ -172,13 +186,18 @@ def write(
     field_string = ",".join([f"{n}={v}" for n, v in field_dict.items()])
     data_string = f"{measurement}{tag_string} {field_string} {timestamp}"
 
-    res = requests.post(
-        url=f"http://{host}:{port}/write",
+    # Writing the same point again overwrites it, so retrying is safe:
+    res = request(
+        "POST",
+        f"http://{host}:{port}/write",
+        host,
+        port,
+        idempotent=True,
         params={"db": db, "precision": precision, **additional_query_parameters},
         data=data_string.encode(),
         headers={"Content-Type": "application/octet-stream"},
     )
-    return True
+    return res.ok
 
 
 # Read functions:
@@ -265,12 +284,21 @@ def read_all(
     port=None,
     db=None,
     output_timestamp_unit="s",
+    parallel=False,
 ):
 
     select = ",".join(field_keys) if field_keys else "*"
 
     query = f'SELECT {select} FROM "{measurement}"'
 
+    if parallel:
+        field_keys, values_list_of_lists = _query_columns(
+            query, host, port, db, output_timestamp_unit
+        )
+        if field_keys is None:
+            raise IndexError(f"No data found in DB {db}, measurement {measurement}")
+        return {f: v for f, v, in zip(field_keys, values_list_of_lists)}
+
     res = _query(query, host, port, db, output_timestamp_unit)
 
     if "series" not in res.json()["results"][0]:
@@ -324,6 +352,7 @@ def read_special_range(
     port=None,
     db=None,
     output_timestamp_unit="s",
+    parallel=False,
 ):
 
     # TODO: last_month, yesterday
@@ -383,27 +412,36 @@ def read_special_range(
         )
 
     query = f'SELECT {select} FROM "{measurement}" WHERE {time_specifier} {groupby}'
-    res = _query(query, host, port, db, output_timestamp_unit)
 
-    if "series" not in res.json()["results"][0]:
-        return {}
+    if parallel:
+        columns, values_list_of_lists = _query_columns(
+            query, host, port, db, output_timestamp_unit
+        )
+        if columns is None:
+            return {}
+    else:
+        res = _query(query, host, port, db, output_timestamp_unit)
+
+        if "series" not in res.json()["results"][0]:
+            return {}
+
+        columns = res.json()["results"][0]["series"][0]["columns"]
+        field_values = res.json()["results"][0]["series"][0]["values"]
+        values_list_of_lists = [
+            [v[i] for v in field_values] for i in range(len(field_values[0]))
+        ]
 
     # Assemble field_keys for the response:
     if field_keys:
         result_field_keys = ["time"] + field_keys
     else:
-        result_field_keys = res.json()["results"][0]["series"][0]["columns"]
+        result_field_keys = columns
         if groupby:
             # Remove 'mean_' from the returned field names:
             result_field_keys = [
                 key[5:] if key.startswith("mean_") else key for key in result_field_keys
             ]
 
-    field_values = res.json()["results"][0]["series"][0]["values"]
-    values_list_of_lists = [
-        [v[i] for v in field_values] for i in range(len(field_values[0]))
-    ]
-
     data_dict = {f: v for f, v, in zip(result_field_keys, values_list_of_lists)}
 
     return data_dict
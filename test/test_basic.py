@@ -21,6 +21,14 @@ def test_ping():
     ), "Ping {simpleinflux.default_host}:{simpleinflux.default_port} failed"
 
 
+def test_ping_cached():
+    assert simpleinflux.ping(use_cache=False)
+    assert simpleinflux.ping()
+
+    simpleinflux.reset_health()
+    assert simpleinflux.ping()
+
+
 def test_get_version():
     version_string = simpleinflux.get_influx_version()
     assert isinstance(version_string, str)
@@ -112,6 +120,20 @@ def test_read_field(test_db):
     assert "temperature" not in data
 
 
+def test_read_all_parallel(test_db, monkeypatch):
+    # Force the process pool even for this tiny response:
+    monkeypatch.setattr(simpleinflux, "parallel_parse_threshold", 0)
+    monkeypatch.setattr(simpleinflux, "parallel_parse_processes", 2)
+    monkeypatch.setattr(simpleinflux, "parallel_parse_chunk_size", 1)
+    timestamp_list_s = (1_654_505_295, 1_654_505_296, 1_654_505_297)
+    for timestamp_s in timestamp_list_s:
+        assert simpleinflux.write(test_msmt, timestamp_s, {"temperature": 12})
+    data = simpleinflux.read_all(test_msmt, parallel=True)
+    assert data == simpleinflux.read_all(test_msmt)
+    assert data["time"] == list(timestamp_list_s)
+    assert data["temperature"] == [12, 12, 12]
+
+
 # ============================================================================
 
 
@@ -0,0 +1,155 @@
+import os
+import json
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from simpleinflux import parallel_parse
+
+
+def chunk_line(columns, values, error=None):
+    result = {"statement_id": 0}
+    if error:
+        result["error"] = error
+    else:
+        result["series"] = [{"name": "msmt", "columns": columns, "values": values}]
+    return json.dumps({"results": [result]}) + "\n"
+
+
+def make_body(columns, rows, chunk_size):
+    lines = [
+        chunk_line(columns, rows[i : i + chunk_size])
+        for i in range(0, len(rows), chunk_size)
+    ]
+    return "".join(lines).encode()
+
+
+def parse_in_process(body):
+    return parallel_parse.parse_chunked_response(body, threshold=len(body) + 1)
+
+
+def parse_in_pool(body):
+    return parallel_parse.parse_chunked_response(body, threshold=0, processes=3)
+
+
+def shm_blocks():
+    return set(os.listdir("/dev/shm"))
+
+
+def dying_worker(*args):
+    os._exit(1)
+
+
+def test_split_at_newlines():
+    body = b"aa\nbbbb\nc\nddd\n"
+    ranges = parallel_parse._split_at_newlines(body, 3)
+    assert b"".join(body[start:end] for start, end in ranges) == body
+    assert all(body[end - 1 : end] == b"\n" for _, end in ranges)
+    assert parallel_parse._split_at_newlines(b"no newline", 4) == [(0, 10)]
+
+
+@pytest.mark.parametrize(
+    "values",
+    (
+        [1, 2, 3],
+        [1, None, 3],
+        [0.5, 20, None, 20.5],
+        [True, False, None],
+        ["a", "b\nc", None],
+        [2 ** 63, 1],
+        [2 ** 60, 0.5],
+        [None, None],
+    ),
+)
+def test_shared_memory_round_trip(values):
+    descriptor = parallel_parse._column_to_shared_memory(values)
+    result = parallel_parse._column_from_shared_memory(descriptor, len(values))
+    assert result == values
+    assert [type(v) for v in result] == [type(v) for v in values]
+
+
+def test_pool_matches_in_process():
+    columns = ["time", "int", "float", "mixed", "bool", "string", "big"]
+    rows = [
+        [
+            1_654_505_295 + i,
+            i if i % 5 else None,
+            i * 0.5,
+            20 if i % 2 else 20.5,
+            i % 3 == 0,
+            f"s\n{i}",
+            2 ** 63 + i,
+        ]
+        for i in range(1000)
+    ]
+    body = make_body(columns, rows, chunk_size=37)
+
+    in_process = parse_in_process(body)
+    in_pool = parse_in_pool(body)
+
+    assert in_pool == in_process
+    for column_in_pool, column_in_process in zip(in_pool[1], in_process[1]):
+        assert [type(v) for v in column_in_pool] == [type(v) for v in column_in_process]
+    assert in_pool[0] == columns
+    assert in_pool[1][0] == [row[0] for row in rows]
+
+
+def test_no_series():
+    body = b'{"results":[{"statement_id":0}]}\n' * 4
+    assert parse_in_process(body) == (None, [])
+    assert parse_in_pool(body) == (None, [])
+
+
+def test_error_in_later_chunk_does_not_leak():
+    columns = ["time", "value"]
+    body = make_body(columns, [[i, i * 0.5] for i in range(300)], chunk_size=10)
+    body += chunk_line(columns, None, error="something went wrong").encode()
+
+    blocks_before = shm_blocks()
+    with pytest.raises(ValueError, match="something went wrong"):
+        parse_in_pool(body)
+    assert shm_blocks() == blocks_before
+
+    with pytest.raises(ValueError, match="something went wrong"):
+        parse_in_process(body)
+
+
+def test_parse_lines_from_memoryview():
+    body = make_body(["time", "value"], [[i, "x\ny"] for i in range(50)], chunk_size=7)
+    assert parallel_parse._parse_lines(memoryview(body)) == parallel_parse._parse_lines(
+        body
+    )
+
+
+def test_pool_is_sized_by_body(monkeypatch):
+    body = make_body(["time", "value"], [[i, i] for i in range(100)], chunk_size=10)
+
+    def no_pool(body, processes):
+        raise AssertionError("Should have been parsed in-process")
+
+    monkeypatch.setattr(parallel_parse, "_parse_in_pool", no_pool)
+    # Just under two ranges of threshold bytes, so a pool isn't worth it:
+    threshold = len(body) // 2 + 1
+    columns, values = parallel_parse.parse_chunked_response(
+        body, threshold=threshold, processes=64
+    )
+    assert values[0] == list(range(100))
+
+    used_processes = []
+    monkeypatch.setattr(
+        parallel_parse,
+        "_parse_in_pool",
+        lambda body, processes: used_processes.append(processes),
+    )
+    parallel_parse.parse_chunked_response(body, threshold=len(body) // 3, processes=64)
+    assert used_processes == [3]
+
+
+def test_dying_worker_raises(monkeypatch):
+    monkeypatch.setattr(parallel_parse, "_parse_range_worker", dying_worker)
+    body = make_body(["time", "value"], [[i, i] for i in range(300)], chunk_size=10)
+
+    blocks_before = shm_blocks()
+    with pytest.raises(BrokenProcessPool):
+        parse_in_pool(body)
+    assert shm_blocks() == blocks_before
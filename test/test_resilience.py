@@ -0,0 +1,210 @@
+import pytest
+import requests
+
+import simpleinflux
+from simpleinflux import resilience
+
+host = "localhost"
+port = 8086
+url = f"http://{host}:{port}/ping"
+
+
+def make_response(status_code, headers={}):
+    res = requests.Response()
+    res.status_code = status_code
+    res.headers.update(headers)
+    return res
+
+
+class FakeServer:
+    """ Stands in for requests.request, answering from a list of outcomes """
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = []
+
+    def __call__(self, method, url, **kwargs):
+        self.calls.append(kwargs)
+        outcome = self.outcomes.pop(0) if len(self.outcomes) > 1 else self.outcomes[0]
+        if callable(outcome):
+            outcome = outcome()
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return make_response(*outcome) if isinstance(outcome, tuple) else outcome
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch):
+    simpleinflux.reset_health()
+    monkeypatch.setattr(simpleinflux, "retries", 3)
+    monkeypatch.setattr(simpleinflux, "backoff_max", 10.0)
+    monkeypatch.setattr(simpleinflux, "retry_after_max", 60.0)
+    monkeypatch.setattr(simpleinflux, "circuit_breaker_threshold", 2)
+    monkeypatch.setattr(simpleinflux, "circuit_breaker_timeout", 30.0)
+    yield
+    simpleinflux.reset_health()
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(resilience.time, "sleep", sleeps.append)
+    return sleeps
+
+
+def serve(monkeypatch, *outcomes):
+    server = FakeServer(*outcomes)
+    monkeypatch.setattr(requests, "request", server)
+    return server
+
+
+def open_circuit(monkeypatch):
+    monkeypatch.setattr(simpleinflux, "retries", 0)
+    serve(monkeypatch, requests.exceptions.ConnectionError())
+    for _ in range(simpleinflux.circuit_breaker_threshold):
+        with pytest.raises(ConnectionError, match="Could not connect"):
+            resilience.request("GET", url, host, port)
+    assert resilience.get_health(host, port).is_open()
+
+
+def expire_circuit_timeout():
+    resilience.get_health(host, port).opened_at -= simpleinflux.circuit_breaker_timeout
+
+
+def test_retries_503(monkeypatch, sleeps):
+    server = serve(monkeypatch, (503,))
+    res = resilience.request("GET", url, host, port)
+    assert res.status_code == 503
+    assert len(server.calls) == simpleinflux.retries + 1
+    assert len(sleeps) == simpleinflux.retries
+
+
+def test_retries_until_ok(monkeypatch, sleeps):
+    server = serve(monkeypatch, (503,), requests.exceptions.ConnectTimeout(), (204,))
+    assert resilience.request("GET", url, host, port).status_code == 204
+    assert len(server.calls) == 3
+
+
+def test_timeout_is_passed(monkeypatch, sleeps):
+    server = serve(monkeypatch, (204,))
+    resilience.request("GET", url, host, port)
+    assert server.calls[0]["timeout"] == simpleinflux.request_timeout
+
+
+def test_retry_after_is_honoured(monkeypatch, sleeps):
+    # Longer than backoff_max, which only caps our own backoff:
+    server = serve(monkeypatch, (503, {"Retry-After": "30"}), (204,))
+    assert resilience.request("GET", url, host, port).status_code == 204
+    assert len(server.calls) == 2
+    assert sleeps[0] >= 30
+
+
+def test_retry_after_over_cap_gives_up(monkeypatch, sleeps):
+    server = serve(monkeypatch, (503, {"Retry-After": "100"}), (204,))
+    assert resilience.request("GET", url, host, port).status_code == 503
+    assert len(server.calls) == 1
+    assert sleeps == []
+
+
+def test_read_timeout_is_not_retried_and_not_counted(monkeypatch, sleeps):
+    server = serve(monkeypatch, requests.exceptions.ReadTimeout())
+    for _ in range(simpleinflux.circuit_breaker_threshold):
+        with pytest.raises(TimeoutError):
+            resilience.request("GET", url, host, port)
+    assert len(server.calls) == simpleinflux.circuit_breaker_threshold
+    assert sleeps == []
+    assert resilience.get_health(host, port).consecutive_failures == 0
+    assert not resilience.get_health(host, port).is_open()
+
+
+@pytest.mark.parametrize("headers", ({}, {"Retry-After": "100"}))
+def test_exhausted_429_is_not_counted(monkeypatch, sleeps, headers):
+    serve(monkeypatch, (429, headers))
+    for _ in range(simpleinflux.circuit_breaker_threshold):
+        assert resilience.request("GET", url, host, port).status_code == 429
+    assert resilience.get_health(host, port).consecutive_failures == 0
+    assert not resilience.get_health(host, port).is_open()
+
+
+def test_only_idempotent_requests_are_retried(monkeypatch, sleeps):
+    server = serve(monkeypatch, (503,))
+    assert resilience.request("POST", url, host, port).status_code == 503
+    assert len(server.calls) == 1
+
+    assert resilience.request("POST", url, host, port, idempotent=True).status_code == 503
+    assert len(server.calls) == 1 + simpleinflux.retries + 1
+
+
+def test_server_error_is_not_retried_and_not_healthy(monkeypatch, sleeps):
+    server = serve(monkeypatch, (500,))
+    assert resilience.request("GET", url, host, port).status_code == 500
+    assert len(server.calls) == 1
+    assert not resilience.get_health(host, port).recently_ok()
+
+    assert not simpleinflux.ping(raise_on_fail=False)
+    assert len(server.calls) == 2
+
+
+def test_circuit_opens_and_fails_fast(monkeypatch, sleeps):
+    open_circuit(monkeypatch)
+    server = serve(monkeypatch, (204,))
+    with pytest.raises(ConnectionError, match="Circuit open"):
+        resilience.request("GET", url, host, port)
+    assert not simpleinflux.ping(raise_on_fail=False)
+    assert server.calls == []
+
+
+def test_single_trial_after_timeout(monkeypatch, sleeps):
+    open_circuit(monkeypatch)
+    expire_circuit_timeout()
+
+    def concurrent_request():
+        # While the trial is running, everybody else still fails fast:
+        with pytest.raises(ConnectionError, match="Circuit open"):
+            resilience.request("GET", url, host, port)
+        return make_response(204)
+
+    server = serve(monkeypatch, concurrent_request, (204,))
+    assert resilience.request("GET", url, host, port).status_code == 204
+    assert len(server.calls) == 1
+    assert not resilience.get_health(host, port).is_open()
+
+    assert resilience.request("GET", url, host, port).status_code == 204
+    assert len(server.calls) == 2
+
+
+def test_failed_trial_reopens_circuit(monkeypatch, sleeps):
+    open_circuit(monkeypatch)
+    expire_circuit_timeout()
+
+    serve(monkeypatch, requests.exceptions.ConnectionError())
+    with pytest.raises(ConnectionError, match="Could not connect"):
+        resilience.request("GET", url, host, port)
+    with pytest.raises(ConnectionError, match="Circuit open"):
+        resilience.request("GET", url, host, port)
+
+
+def test_interrupted_trial_is_released(monkeypatch, sleeps):
+    open_circuit(monkeypatch)
+    expire_circuit_timeout()
+
+    serve(monkeypatch, KeyboardInterrupt(), (204,))
+    with pytest.raises(KeyboardInterrupt):
+        resilience.request("GET", url, host, port)
+    assert resilience.request("GET", url, host, port).status_code == 204
+
+
+def test_ping_cached(monkeypatch, sleeps):
+    server = serve(monkeypatch, (204,))
+    assert simpleinflux.ping(host=host, port=port)
+    assert len(server.calls) == 1
+
+    assert simpleinflux.ping(host=host, port=port)
+    assert len(server.calls) == 1
+
+    assert simpleinflux.ping(host=host, port=port, use_cache=False)
+    assert len(server.calls) == 2
+
+    monkeypatch.setattr(simpleinflux, "health_cache_ttl", 0)
+    assert simpleinflux.ping(host=host, port=port)
+    assert len(server.calls) == 3